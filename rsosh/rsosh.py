@@ -1,14 +1,25 @@
 """Parse a list of Russian school Olympiad from rsr-olymp.ru."""
 
-import copy
+import codecs
+import contextlib
+import hashlib
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
 from html.parser import HTMLParser
-from http.client import HTTPResponse, HTTPSConnection
+from http import HTTPStatus
+from http.client import HTTPException, HTTPResponse, HTTPSConnection
+from pathlib import Path
 from urllib.parse import urlparse
 
 from attr import dataclass
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Olymp:
     """A representation of a school Olympiad."""
 
@@ -22,11 +33,30 @@ class Olymp:
         return f"{self.number}: {self.name}: {self.lesson} (#{self.level})"
 
 
+_WHITESPACES_RE = re.compile(r"\s+")
+
+# matches if a stripped string has anything to normalize: a run of
+# whitespaces or a whitespace that isn't a space
+_EXTRA_WHITESPACES_RE = re.compile(r"\s\s|[^\S ]")
+
+
 def _remove_extra_whitespaces(s):
-    return " ".join(s.split())
+    # s is expected to be stripped already
+    if _EXTRA_WHITESPACES_RE.search(s):
+        s = _WHITESPACES_RE.sub(" ", s)
+    return s
 
 
-@dataclass
+def _get_attr(attrs, name):
+    # a tag has only a few attributes, a linear scan is cheaper than
+    # building a dict for every tag
+    for key, value in attrs:
+        if key == name:
+            return value
+    return None
+
+
+@dataclass(slots=True)
 class _ParsingOlymp:
     """A class to store parsed parts of Olymp."""
 
@@ -38,8 +68,13 @@ class _ParsingOlymp:
 
     def is_parsed(self) -> bool:
         """Return True, if this Olympiad in parsing process already parsed."""
-        # return true if all values aren't None
-        return all(self.__dict__.values())
+        return (
+            self.number is not None
+            and self.name is not None
+            and self.url is not None
+            and self.lessons is not None
+            and self.levels is not None
+        )
 
 
 def empty_olymp() -> _ParsingOlymp:
@@ -47,98 +82,149 @@ def empty_olymp() -> _ParsingOlymp:
     return _ParsingOlymp(None, None, None, None, None)
 
 
-class Parser(HTMLParser):
-    """A class to parse a web-page with RSR Olympiads table."""
+_DIGITS = frozenset("0123456789")
+
+# states of Parser: outside of the Olympiads table, inside the table,
+# inside its header and inside a table row with Olympiad info
+_STATE_OUT, _STATE_TABLE, _STATE_THEAD, _STATE_TR = range(4)
 
-    # the result fields
-    _is_parsed_olymps_fresh: bool = False
-    _olymps: list[_ParsingOlymp] = []
-    _parsed_olymps: list[Olymp] | None = None
 
-    _current_olymp = empty_olymp()
+class Parser(HTMLParser):
+    """A class to parse a web-page with RSR Olympiads table."""
 
-    # state flags to check the current event, yes it's an anti-pattern
-    # but anyway
-    _in_table = False
-    _in_thead = False
-    _is_parse_olymp = False
+    def __init__(self) -> None:
+        """Create a parser with no parsed Olympiads."""
+        super().__init__()
+
+        # the result fields, _parsed_olymps is built on access and
+        # dropped when a new row is saved
+        self._olymps: list[_ParsingOlymp] = []
+        self._parsed_olymps: list[Olymp] | None = None
+
+        self._current_olymp = empty_olymp()
+
+        # where in the document the parser is now, one of _STATE_*
+        self._state = _STATE_OUT
+
+        # parts of the current text node: HTMLParser reports a text
+        # node split between two fed pieces of data as two ones
+        self._text_parts: list[str] = []
+
+        # only a few tags are interesting, dispatch them by name instead
+        # of comparing every tag with each of them
+        self._starttag_handlers = {
+            "tr": self._handle_tr_start,
+            "a": self._handle_a_start,
+            "table": self._handle_table_start,
+            "thead": self._handle_thead_start,
+        }
+        self._endtag_handlers = {
+            "tr": self._handle_tr_end,
+            "table": self._handle_table_end,
+            "thead": self._handle_thead_end,
+        }
+
+    def close(self) -> None:
+        """Handle all the buffered data."""
+        super().close()
+        self._flush_text()
 
     @property
     def parsed_olymps(self) -> list[Olymp]:
-        """Return already parsed Olympiads."""
-        if self._is_parsed_olymps_fresh:
-            return self._parsed_olymps or []
+        """Return already parsed Olympiads.
 
-        self._is_parsed_olymps_fresh = True
-        olymps = []
+        The list is built once and returned again until a new row is
+        parsed.
+        """
+        if self._parsed_olymps is None:
+            self._parsed_olymps = self._build_olymps()
+        return self._parsed_olymps
 
+    def _build_olymps(self) -> list[Olymp]:
         # NOTE: that one Olymp - one lesson, we can found some olymps
         # with the same name, number but with different lessons.
         #
         # so, ITMO: Physics, ITMO: ICT, ITMO: Math are 3 different olympiads
-        for o in self._olymps:
-            if not o.is_parsed():
-                continue
-
-            for i in range(len(o.levels)):  # type: ignore
-                olymps.append(
-                    Olymp(
-                        number=o.number,  # type: ignore
-                        name=o.name,  # type: ignore
-                        level=o.levels[i],  # type: ignore
-                        url=o.url,  # type: ignore
-                        lesson=o.lessons[i * 2],  # type: ignore
-                    )
-                )
-
-        self._parsed_olymps = olymps
-        return olymps
+        return [
+            Olymp(o.number, o.name, o.url, lesson, level)  # type: ignore
+            for o in self._olymps
+            if o.is_parsed()
+            for level, lesson in zip(
+                o.levels, o.lessons, strict=False  # type: ignore
+            )
+        ]
 
     def handle_starttag(  # noqa
         self, tag: str, attrs: list[tuple[str, str | None]]
     ) -> None:
-        attrs_dict = dict(attrs)
+        if self._text_parts:
+            self._flush_text()
 
-        if tag == "table" and not self._in_table:
-            self._in_table = attrs_dict.get("class") == "mainTableInfo"
-            return
+        handler = self._starttag_handlers.get(tag)
+        if handler is not None:
+            handler(attrs)
 
-        if not self._in_table:
-            return
+    def _handle_table_start(self, attrs) -> None:
+        if (
+            self._state == _STATE_OUT
+            and _get_attr(attrs, "class") == "mainTableInfo"
+        ):
+            self._state = _STATE_TABLE
 
-        # ignore any thing inside </thead> tag
-        if self._in_thead:
-            return
+    def _handle_thead_start(self, _attrs) -> None:
+        if self._state == _STATE_TABLE:
+            self._state = _STATE_THEAD
 
-        if tag == "thead":
-            self._in_thead = True
+    def _handle_tr_start(self, _attrs) -> None:
+        # ignore any thing inside </thead> tag
+        if self._state not in (_STATE_TABLE, _STATE_TR):
             return
 
         # any olympiad info is located inside </tr> tag
-        if tag == "tr":
-            self._is_parse_olymp = True
-            self._current_olymp = empty_olymp()
+        self._state = _STATE_TR
+        self._current_olymp = empty_olymp()
+
+    def _handle_a_start(self, attrs) -> None:
+        if self._state != _STATE_TR:
             return
 
         # inside </a> tag should be located the URL to an olympiad
-        if tag == "a" and self._is_parse_olymp:
-            self._current_olymp.url = attrs_dict.get("href")
-            return
+        url = _get_attr(attrs, "href")
+        self._current_olymp.url = url and sys.intern(url)
 
     def handle_data(self, data: str) -> None:  # noqa
         # handle tag content only if we parse an Olympiad
-        if not self._is_parse_olymp or not self._in_table:
-            return
+        if self._state == _STATE_TR:
+            self._text_parts.append(data)
+
+    def handle_comment(self, data: str) -> None:  # noqa
+        # a comment ends a text node as a tag does
+        if self._text_parts:
+            self._flush_text()
+
+    def _flush_text(self) -> None:
+        data = "".join(self._text_parts)
+        self._text_parts.clear()
+        self._handle_text(data)
+
+    def _handle_text(self, data: str) -> None:
+        # strip and check for digits only once, the checks below reuse
+        # them
+        data = data.strip()
 
         # ignore empty strings
-        if not data.strip("\n\t "):
+        if not data:
             return
 
+        # most of text nodes start with a letter, check the first char
+        # before scanning the whole string
+        is_number = data[0] in _DIGITS and data.isdigit()
+
         # Sometimes, after </tr> can be other <tr> with some
         # additional lessons of this olympiad.
         #
         # Handle this case
-        if self._current_olymp.number is None and not data.isdigit():
+        if self._current_olymp.number is None and not is_number:
             self._current_olymp = self._olymps[-1]
             self._olymps.pop()
 
@@ -155,7 +241,8 @@ class Parser(HTMLParser):
             return
 
         if self._current_olymp.name is None:
-            self._current_olymp.name = _remove_extra_whitespaces(data)
+            name = _remove_extra_whitespaces(data)
+            self._current_olymp.name = sys.intern(name)
             return
 
         # after name can be lessons or level of this olympiad.  If a
@@ -163,61 +250,281 @@ class Parser(HTMLParser):
         if self._current_olymp.levels is None:
             self._current_olymp.levels = []
 
-        if data.isdigit():
+        if is_number:
             self._current_olymp.levels.append(int(data))
             return
 
         if self._current_olymp.lessons is None:
             self._current_olymp.lessons = []
 
-        self._current_olymp.lessons.append(_remove_extra_whitespaces(data))
+        # a level row has two text cells: the profile (it's the lesson)
+        # and the subjects of the profile.  Store only the first one, so
+        # lessons and levels go one to one
+        lessons = self._current_olymp.lessons
+        if len(lessons) == len(self._current_olymp.levels):
+            # the same lessons repeat a lot over the table, so keep only
+            # one string object per value
+            lessons.append(sys.intern(_remove_extra_whitespaces(data)))
 
     def handle_endtag(self, tag: str) -> None:  # noqa
-        if tag == "table":
-            self._in_table = False
+        if self._text_parts:
+            self._flush_text()
 
-        if tag == "thead":
-            self._in_thead = False
-            return
+        handler = self._endtag_handlers.get(tag)
+        if handler is not None:
+            handler()
 
-        if tag == "tr" and self._is_parse_olymp:
-            self._is_parse_olymp = False
+    def _handle_table_end(self) -> None:
+        self._state = _STATE_OUT
+
+    def _handle_thead_end(self) -> None:
+        if self._state == _STATE_THEAD:
+            self._state = _STATE_TABLE
+
+    def _handle_tr_end(self) -> None:
+        if self._state == _STATE_TR:
+            self._state = _STATE_TABLE
             self._save_current_olymp()
-            return
 
     def _save_current_olymp(self) -> None:
-        ol = copy.deepcopy(self._current_olymp)
-        self._olymps.append(ol)
-        self._is_parsed_olymps_fresh = False
+        # the next <tr> starts a new olympiad object, so the saved one
+        # isn't mutated anymore and doesn't need a copy
+        self._olymps.append(self._current_olymp)
+        self._parsed_olymps = None
 
 
 RSR_URL = "https://rsr-olymp.ru"
-CHUNK_SIZE = 1024 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+TIMEOUT = 30
 
+# how long to trust the cache, if the server doesn't say how to check
+# that the page is changed (no ETag and Last-Modified)
+CACHE_TTL = 24 * 60 * 60
 
-def parse_from_web(url=RSR_URL) -> list[Olymp]:
-    """Parse Olympiads from web-page over the http(s) ."""
-    resp = _do_http_request(url)
-    p = Parser()
+# the format of cached Olympiads, bump it when the cache format or the
+# parsing rules change, so old cached results aren't returned anymore
+CACHE_VERSION = 1
+
+
+def parse_from_web(url=RSR_URL, use_cache=True) -> list[Olymp]:
+    """Parse Olympiads from web-page over the http(s) .
+
+    The parsed Olympiads are cached on disk.  While the page isn't
+    changed (the server answers 304 Not Modified), return them without
+    parsing the page again.
+    """
+    cache = _read_cache(url) if use_cache else None
+    headers = {}
+
+    if cache is not None:
+        if cache["etag"]:
+            headers["If-None-Match"] = cache["etag"]
+        if cache["last_modified"]:
+            headers["If-Modified-Since"] = cache["last_modified"]
+        if not headers and time.time() - cache["time"] < CACHE_TTL:
+            return cache["olymps"]
+
+    resp = _do_http_request(url, headers)
+
+    if cache is not None and resp.status == HTTPStatus.NOT_MODIFIED:
+        resp.read()
+        return cache["olymps"]
+
+    try:
+        olymps = _parse_response(resp)
+    except BaseException:
+        # the reader thread may still be reading the response: the
+        # connection can't be reused, and closing it here would wait
+        # for the reader
+        _connections.by_host.pop(urlparse(url).hostname, None)
+        raise
 
-    chunk = resp.read(CHUNK_SIZE)
-    while chunk:
-        p.feed(chunk.decode("utf-8"))
-        chunk = resp.read(CHUNK_SIZE)
+    if use_cache and resp.status == HTTPStatus.OK:
+        _write_cache(url, resp, olymps)
 
+    return olymps
+
+
+def _parse_response(resp) -> list[Olymp]:
+    p = Parser()
+
+    # read the response in other thread: waiting for the network
+    # releases the GIL there, so it overlaps with parsing here
+    chunks: queue.Queue = queue.Queue(maxsize=4)
+    stop = threading.Event()
+    reader = threading.Thread(
+        target=_read_response, args=(resp, chunks, stop), daemon=True
+    )
+    reader.start()
+
+    try:
+        while (chunk := _get_chunk(chunks)) is not None:
+            p.feed(chunk)
+    except BaseException:
+        # the reader may wait for a free place in the queue: free the
+        # queue so it can see the stop and finish.  Don't wait for it,
+        # it's a daemon thread and may hang in a slow socket read
+        stop.set()
+        with contextlib.suppress(queue.Empty):
+            while True:
+                chunks.get_nowait()
+        raise
+
+    p.close()
     return p.parsed_olymps
 
 
-def _do_http_request(url) -> HTTPResponse:
-    u = urlparse(url)
-    return _http_request_to_host(u.hostname, u.path)
+def _read_response(resp, chunks, stop) -> None:
+    # put decoded chunks of the response to the queue, then None.  An
+    # exception is put before None to raise it in the parsing thread
+    try:
+        # read every chunk into the same buffer instead of allocating
+        # new bytes for each one
+        buf = bytearray(CHUNK_SIZE)
+        view = memoryview(buf)
+        kept = 0
+
+        while not stop.is_set() and (n := resp.readinto(view[kept:])):
+            end = kept + n
+            text, decoded = codecs.utf_8_decode(view[:end], "strict", False)
+            chunks.put(text)
 
+            # a multi-byte character can be split between two chunks,
+            # keep its start to decode it with the next chunk
+            kept = end - decoded
+            buf[:kept] = buf[decoded:end]
 
-def _http_request_to_host(host, uri="/") -> HTTPResponse:
-    c = HTTPSConnection(host)
-    c.request("GET", uri)
-    resp = c.getresponse()
-    return resp
+        # raises on a truncated character at the end
+        codecs.utf_8_decode(view[:kept], "strict", True)
+    except Exception as e:
+        chunks.put(e)
+    finally:
+        chunks.put(None)
+
+
+def _get_chunk(chunks):
+    chunk = chunks.get()
+    if isinstance(chunk, Exception):
+        raise chunk
+    return chunk
+
+
+def _do_http_request(url, headers=None) -> HTTPResponse:
+    u = urlparse(url)
+    return _http_request_to_host(u.hostname, u.path, headers)
+
+
+class _Connections(threading.local):
+    """Keep-alive connections by host, the own ones for every thread.
+
+    Repeated requests to a host don't do TCP and TLS handshakes again.
+    HTTPSConnection isn't thread-safe, so only the thread that owns a
+    connection sends requests with it.  The response body is read by
+    a reader thread (see _parse_response), while the owner waits for
+    it; if parsing fails, the connection is dropped from the pool.
+    """
+
+    def __init__(self) -> None:
+        self.by_host: dict[str, HTTPSConnection] = {}
+
+
+_connections = _Connections()
+
+
+def _http_request_to_host(host, uri="/", headers=None) -> HTTPResponse:
+    headers = headers or {}
+    connections = _connections.by_host
+    c = connections.get(host)
+
+    if c is not None:
+        try:
+            c.request("GET", uri, headers=headers)
+            return c.getresponse()
+        except (HTTPException, ConnectionError):
+            # the server may close an idle connection, or the previous
+            # response wasn't read till the end, just reconnect
+            c.close()
+    else:
+        c = connections[host] = HTTPSConnection(host, timeout=TIMEOUT)
+
+    c.request("GET", uri, headers=headers)
+    return c.getresponse()
+
+
+def _cache_path(url) -> Path:
+    cache_dir = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    name = hashlib.sha256(url.encode()).hexdigest()[:16]
+    return Path(cache_dir) / "rsosh" / f"{name}.json"
+
+
+_OLYMP_FIELD_TYPES = (int, str, str, str, int)
+
+
+def _read_cache(url):
+    try:
+        with _cache_path(url).open(encoding="utf-8") as f:
+            cache = json.load(f)
+        version = cache["version"]
+        etag = cache["etag"]
+        last_modified = cache["last_modified"]
+        cached_at = cache["time"]
+        olymps = cache["olymps"]
+    except (OSError, ValueError, KeyError, TypeError):
+        # no cache yet or it's broken, anyway parse the page again
+        return None
+
+    if (
+        version != CACHE_VERSION
+        or not isinstance(etag, str | None)
+        or not isinstance(last_modified, str | None)
+        or isinstance(cached_at, bool)
+        or not isinstance(cached_at, int | float)
+        or not isinstance(olymps, list)
+        or not all(_is_cached_olymp(o) for o in olymps)
+    ):
+        return None
+
+    return {
+        "etag": etag,
+        "last_modified": last_modified,
+        "time": cached_at,
+        "olymps": [Olymp(*o) for o in olymps],
+    }
+
+
+def _is_cached_olymp(o) -> bool:
+    return (
+        isinstance(o, list)
+        and len(o) == len(_OLYMP_FIELD_TYPES)
+        and all(
+            isinstance(v, t) and not isinstance(v, bool)
+            for v, t in zip(o, _OLYMP_FIELD_TYPES, strict=True)
+        )
+    )
+
+
+def _write_cache(url, resp, olymps) -> None:
+    cache = {
+        "version": CACHE_VERSION,
+        "etag": resp.getheader("ETag"),
+        "last_modified": resp.getheader("Last-Modified"),
+        "time": time.time(),
+        "olymps": [
+            [o.number, o.name, o.url, o.lesson, o.level] for o in olymps
+        ],
+    }
+
+    path = _cache_path(url)
+    tmp_path = path.with_suffix(".tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(cache, f, ensure_ascii=False)
+        # replace at once, so a reader never sees a half-written file
+        tmp_path.replace(path)
+    except OSError:
+        # the cache is only an optimization
+        pass
 
 
 def _main():